@@ -5,11 +5,61 @@ Securities Lending Position Adjustment Journal Generator
 证券借贷项目头寸调整日记账自动生成工具
 """
 
+import codecs
+import logging
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import sys
+import xlsxwriter
 from datetime import datetime
+from importlib.util import find_spec
 from pathlib import Path
 
 
+logger = logging.getLogger(__name__)
+
+# Keep frames Arrow-backed end to end so string keys and numeric columns
+# are handled by Arrow compute kernels rather than Python objects
+ARROW = True
+DTYPE_BACKEND = 'pyarrow' if ARROW else 'numpy_nullable'
+TEXT_DTYPE = pd.ArrowDtype(pa.string()) if ARROW else 'string'
+
+# Known column types for position files; other columns are inferred.
+# Quantities are floats since fund units and bond face amounts can be
+# fractional.
+POSITION_DTYPES = {
+    'security_id': TEXT_DTYPE,
+    'account': TEXT_DTYPE,
+    'quantity': 'double[pyarrow]' if ARROW else 'float64',
+    'value': 'double[pyarrow]' if ARROW else 'float64',
+}
+
+# Excel key columns can mix numeric cells (000001 stored as 1) with text
+# cells, which Arrow cannot convert directly; read them as pandas strings
+# first and cast to POSITION_DTYPES afterwards
+EXCEL_DTYPES = {
+    'security_id': 'string',
+    'account': 'string',
+    'quantity': 'float64',
+    'value': 'float64',
+}
+
+# Entry templates indexed by direction (0 = return, 1 = borrow); only the
+# security, account and amounts vary from row to row
+DEBIT_ACCOUNTS = pd.Index(
+    ['Payable for Securities', 'Securities Borrowed'], dtype=TEXT_DTYPE
+)
+CREDIT_ACCOUNTS = pd.Index(
+    ['Securities Borrowed', 'Payable for Securities'], dtype=TEXT_DTYPE
+)
+DESCRIPTION_PREFIXES = np.array(['Return securities ', 'Borrow securities '])
+
+# python-calamine reads Excel files several times faster than openpyxl
+EXCEL_READ_ENGINE = 'calamine' if find_spec('python_calamine') else None
+
+
 class JournalGenerator:
     """Generate journals for position adjustments in securities lending program"""
 
@@ -36,13 +86,24 @@ class JournalGenerator:
         file_path = Path(file_path)
 
         if file_path.suffix.lower() == '.csv':
-            df = pd.read_csv(file_path)
+            df = pd.read_csv(
+                file_path,
+                engine='pyarrow',
+                dtype_backend=DTYPE_BACKEND,
+                dtype=POSITION_DTYPES,
+            )
         elif file_path.suffix.lower() in ['.xlsx', '.xls']:
-            df = pd.read_excel(file_path)
+            df = pd.read_excel(
+                file_path, engine=EXCEL_READ_ENGINE, dtype=EXCEL_DTYPES
+            )
+            df = df.astype({
+                column: dtype for column, dtype in POSITION_DTYPES.items()
+                if column in df.columns
+            })
         else:
             raise ValueError(f"Unsupported file format: {file_path.suffix}")
 
-        print(f"✓ Loaded {len(df)} records")
+        logger.info("✓ Loaded %d records", len(df))
         return df
 
     def calculate_adjustments(self, current_positions, previous_positions=None):
@@ -57,31 +118,48 @@ class JournalGenerator:
             DataFrame: Adjustment data
         """
         if previous_positions is not None:
-            # Merge current and previous data to calculate changes
-            merged = pd.merge(
-                current_positions,
-                previous_positions,
-                on=['security_id', 'account'],
-                how='outer',
-                suffixes=('_current', '_previous')
-            ).fillna(0)
-
-            merged['quantity_change'] = (
-                merged['quantity_current'] - merged['quantity_previous']
-            )
-            merged['value_change'] = (
-                merged['value_current'] - merged['value_previous']
-            )
+            # Align both days on the position key and subtract; missing
+            # values and keys missing on either side count as zero
+            keys = ['security_id', 'account']
+            current = current_positions.set_index(keys)[['quantity', 'value']].fillna(0)
+            previous = previous_positions.set_index(keys)[['quantity', 'value']].fillna(0)
+            if not (current.index.is_unique and previous.index.is_unique):
+                raise ValueError("Duplicate (security_id, account) positions")
+
+            if (
+                len(current) and len(previous)
+                and current.index.is_monotonic_increasing
+                and previous.index.is_monotonic_increasing
+            ):
+                # Position files usually arrive sorted by key, so an ordered
+                # join aligns both days in one linear pass without hashing
+                index, left, right = current.index.join(
+                    previous.index, how='outer', return_indexers=True
+                )
+                diff = pd.DataFrame({
+                    column: _take_aligned(current[column], left)
+                    - _take_aligned(previous[column], right)
+                    for column in ('quantity', 'value')
+                }, index=index)
+            else:
+                diff = current.sub(previous, fill_value=0)
+
+            # Both paths return the dtypes a plain subtraction would give
+            diff = diff.astype((current.iloc[:0] - previous.iloc[:0]).dtypes.to_dict())
 
             # Keep only records with changes
-            adjustments = merged[
-                (merged['quantity_change'] != 0) | (merged['value_change'] != 0)
-            ].copy()
+            adjustments = diff[
+                (diff['quantity'] != 0) | (diff['value'] != 0)
+            ].reset_index().rename(columns={
+                'quantity': 'quantity_change',
+                'value': 'value_change',
+            })
         else:
             # If no previous data, all current positions are new
-            adjustments = current_positions.copy()
-            adjustments['quantity_change'] = adjustments['quantity']
-            adjustments['value_change'] = adjustments['value']
+            adjustments = current_positions[['security_id', 'account']].assign(
+                quantity_change=current_positions['quantity'].to_numpy(),
+                value_change=current_positions['value'].to_numpy(),
+            ).reset_index(drop=True)
 
         return adjustments
 
@@ -91,7 +169,8 @@ class JournalGenerator:
 
         Args:
             adjustments: Position adjustment data
-            date: Journal date (defaults to today)
+            date: Journal date as text, or a date/datetime to write it as an
+                Excel date cell (defaults to today)
 
         Returns:
             DataFrame: Journal entries
@@ -99,41 +178,61 @@ class JournalGenerator:
         if date is None:
             date = datetime.now().strftime('%Y-%m-%d')
 
-        entries = []
-
-        for _, row in adjustments.iterrows():
-            security_id = row.get('security_id', row.get('security_id_current', 'UNKNOWN'))
-            account = row.get('account', row.get('account_current', 'UNKNOWN'))
-            quantity_change = row['quantity_change']
-            value_change = row['value_change']
-
-            if quantity_change > 0:
-                # Borrowed securities increase
-                entries.append({
-                    'date': date,
-                    'security_id': security_id,
-                    'account': account,
-                    'debit_account': 'Securities Borrowed',
-                    'credit_account': 'Payable for Securities',
-                    'quantity': abs(quantity_change),
-                    'amount': abs(value_change),
-                    'description': f'Borrow securities {security_id}'
-                })
-            elif quantity_change < 0:
-                # Borrowed securities decrease (return)
-                entries.append({
-                    'date': date,
-                    'security_id': security_id,
-                    'account': account,
-                    'debit_account': 'Payable for Securities',
-                    'credit_account': 'Securities Borrowed',
-                    'quantity': abs(quantity_change),
-                    'amount': abs(value_change),
-                    'description': f'Return securities {security_id}'
-                })
-
-        journal_df = pd.DataFrame(entries)
-        print(f"✓ Generated {len(journal_df)} journal entries")
+        # Normalize merge-suffixed key columns once so the rest of the
+        # method reads a single canonical column
+        for column in ('security_id', 'account'):
+            if column in adjustments.columns:
+                continue
+            if f'{column}_current' in adjustments.columns:
+                adjustments = adjustments.rename(columns={f'{column}_current': column})
+            else:
+                adjustments = adjustments.assign(**{column: 'UNKNOWN'})
+
+        quantity_change = adjustments['quantity_change'].to_numpy()
+        value_change = adjustments['value_change'].to_numpy()
+        security_id = adjustments['security_id'].array
+        account = adjustments['account'].array
+
+        # Positive changes are borrows, negative changes are returns;
+        # unchanged quantities produce no entry. Row order is preserved.
+        borrow = quantity_change > 0
+        mask = borrow | (quantity_change < 0)
+        direction = borrow[mask].astype(np.int8)
+        security_id = security_id[mask]
+
+        # Description text for each key. Typed keys cast directly; object
+        # keys may mix numbers and text, so str() each one as an f-string
+        # would. Missing keys read '<NA>' either way.
+        key_text = pd.Series(security_id)
+        if _is_object_like(key_text):
+            key_text = np.asarray(security_id, dtype=object).astype(str)
+        key_text = pd.Series(key_text, dtype=TEXT_DTYPE).fillna('<NA>')
+
+        journal_df = pd.DataFrame({
+            'date': date,
+            'security_id': security_id,
+            'account': account[mask],
+            'debit_account': pd.Categorical.from_codes(
+                direction, categories=DEBIT_ACCOUNTS
+            ),
+            'credit_account': pd.Categorical.from_codes(
+                direction, categories=CREDIT_ACCOUNTS
+            ),
+            'quantity': np.abs(quantity_change[mask]),
+            'amount': np.abs(value_change[mask]),
+            'description': (
+                pd.Series(DESCRIPTION_PREFIXES[direction], dtype=TEXT_DTYPE)
+                + key_text
+            ),
+        })
+        if isinstance(date, str):
+            journal_df['date'] = journal_df['date'].astype(TEXT_DTYPE)
+
+        # Keys repeat heavily; store them as categories
+        for column in ('security_id', 'account'):
+            journal_df[column] = journal_df[column].astype('category')
+
+        logger.info("✓ Generated %d journal entries", len(journal_df))
 
         return journal_df
 
@@ -154,26 +253,25 @@ class JournalGenerator:
 
         output_path = self.output_dir / filename
 
-        with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
+        # constant_memory streams each row to disk as it is written, so
+        # every sheet must be written strictly row by row
+        workbook = xlsxwriter.Workbook(
+            output_path, {'constant_memory': True, 'default_date_format': 'yyyy-mm-dd'}
+        )
+        with workbook:
             # Main sheet: Journal entries
-            journal_entries.to_excel(writer, sheet_name='Journal Entries', index=False)
+            _write_sheet(workbook, 'Journal Entries', journal_entries)
 
-            # Summary sheet: By security
             if not journal_entries.empty:
-                summary = journal_entries.groupby('security_id').agg({
-                    'quantity': 'sum',
-                    'amount': 'sum'
-                }).reset_index()
-                summary.to_excel(writer, sheet_name='Summary by Security', index=False)
+                # Summary sheet: By security
+                summary = _summarize(journal_entries, 'security_id')
+                _write_sheet(workbook, 'Summary by Security', summary)
 
                 # Summary sheet: By account
-                account_summary = journal_entries.groupby('account').agg({
-                    'quantity': 'sum',
-                    'amount': 'sum'
-                }).reset_index()
-                account_summary.to_excel(writer, sheet_name='Summary by Account', index=False)
+                account_summary = _summarize(journal_entries, 'account')
+                _write_sheet(workbook, 'Summary by Account', account_summary)
 
-        print(f"✓ Exported to: {output_path}")
+        logger.info("✓ Exported to: %s", output_path)
         return output_path
 
     def export_to_csv(self, journal_entries, filename=None):
@@ -192,12 +290,98 @@ class JournalGenerator:
             filename = f'journal_entries_{timestamp}.csv'
 
         output_path = self.output_dir / filename
-        journal_entries.to_csv(output_path, index=False, encoding='utf-8-sig')
-
-        print(f"✓ Exported to: {output_path}")
+        # Arrow needs one type per column, so render mixed-type object
+        # columns (e.g. security codes read as both text and numbers) as
+        # text; timestamps are rendered by pandas to keep to_csv's format
+        text = {}
+        for column in journal_entries.columns:
+            if _is_object_like(journal_entries[column]):
+                text[column] = journal_entries[column].astype(object).map(
+                    str, na_action='ignore'
+                )
+            elif pd.api.types.is_datetime64_any_dtype(journal_entries[column]):
+                text[column] = journal_entries[column].astype(str)
+        table = pa.Table.from_pandas(
+            journal_entries.assign(**text), preserve_index=False
+        )
+        with open(output_path, 'wb') as f:
+            # Keep the UTF-8 BOM (as utf-8-sig did) so Excel detects the encoding
+            f.write(codecs.BOM_UTF8)
+            pacsv.write_csv(table, f)
+
+        logger.info("✓ Exported to: %s", output_path)
         return output_path
 
 
+def _is_object_like(column):
+    """Whether a column holds Python objects, directly or as categories"""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.categories.dtype == object
+    return column.dtype == object
+
+
+def _take_aligned(column, indexer):
+    """Reorder a column by a join indexer, with zero for missing (-1) rows"""
+    values = column.to_numpy()
+    if indexer is None:
+        return values
+    return np.where(indexer >= 0, values[indexer], 0)
+
+
+def _summarize(journal_entries, key):
+    """
+    Sum quantity and amount per key value
+
+    There are only a handful of securities and accounts, so a bincount over
+    the factorized key avoids groupby's per-group overhead.
+    """
+    codes, uniques = pd.factorize(journal_entries[key], sort=False)
+    valid = codes >= 0
+    summary = {key: uniques}
+    for column in ('quantity', 'amount'):
+        # Sums are much slower over strided (F-ordered) buffers; copy only
+        # this column, and only when it is not already contiguous
+        values = np.ascontiguousarray(journal_entries[column].to_numpy())
+        # Skip missing amounts, as groupby().sum() does
+        rows = valid & ~np.isnan(values) if values.dtype.kind == 'f' else valid
+        totals = np.bincount(
+            codes[rows], weights=values[rows], minlength=len(uniques)
+        )
+        summary[column] = totals.astype(values.dtype) if values.dtype.kind in 'iu' else totals
+
+    # Built flat from the uniques, so no group index is materialized; sort
+    # the few summary rows rather than re-coding every journal row.
+    # factorize's ordering also copes with keys mixing numbers and text.
+    summary = pd.DataFrame(summary)
+    ranks = pd.factorize(summary[key], sort=True)[0]
+    return summary.take(np.argsort(ranks)).reset_index(drop=True)
+
+
+def _write_sheet(workbook, sheet_name, df):
+    """Write a DataFrame to a new worksheet in row order, without index"""
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, df.columns)
+
+    # Only pay for per-cell conversion when some value needs it
+    needs_conversion = df.isna().to_numpy().any() or any(
+        np.isinf(df[column].to_numpy(dtype=float)).any()
+        for column in df.columns if pd.api.types.is_float_dtype(df[column])
+    )
+    for row_num, row in enumerate(df.itertuples(index=False, name=None), start=1):
+        if needs_conversion:
+            row = [_excel_value(value) for value in row]
+        worksheet.write_row(row_num, 0, row)
+
+
+def _excel_value(value):
+    """Match DataFrame.to_excel: blank for missing values, text for infinities"""
+    if pd.isna(value):
+        return None
+    if isinstance(value, float) and np.isinf(value):
+        return 'inf' if value > 0 else '-inf'
+    return value
+
+
 def create_sample_data():
     """Create sample data for testing"""
     sample_data = {
@@ -222,6 +406,8 @@ def create_sample_data():
 
 def main():
     """Main function - demonstration"""
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+
     print("=" * 60)
     print("Securities Lending Journal Generator")
     print("=" * 60)
@@ -6,18 +6,23 @@ Merges multiple PDF files into a single PDF document.
 
 import sys
 from pathlib import Path
-from PyPDF2 import PdfMerger
+from pypdf import PdfWriter
 
 
-def merge_pdfs(pdf_files, output_file):
+def merge_pdfs(pdf_files, output_file, import_outline=True):
     """
     Merge multiple PDF files into a single PDF.
 
+    Each input is opened, appended and closed in turn, so only one input
+    file is held open at a time.
+
     Args:
         pdf_files: List of PDF file paths to merge
         output_file: Output file path for the merged PDF
+        import_outline: Copy bookmarks from the inputs (set False to skip
+            outline merging on very large batches)
     """
-    merger = PdfMerger()
+    writer = PdfWriter()
 
     try:
         for pdf_file in pdf_files:
@@ -31,11 +36,12 @@ def merge_pdfs(pdf_files, output_file):
                 continue
 
             print(f"Adding: {pdf_file}")
-            merger.append(str(pdf_path))
+            with open(pdf_path, 'rb') as f:
+                writer.append(f, import_outline=import_outline)
 
         print(f"\nMerging PDFs into: {output_file}")
-        merger.write(output_file)
-        merger.close()
+        writer.write(output_file)
+        writer.close()
         print("Successfully merged PDFs!")
         return True
 
@@ -69,6 +75,7 @@ if __name__ == "__main__":
 
 """
 Example usage:
+pip install pypdf
 cd ~/Desktop/folder_name
 pthon3 pdf.merger.py output.pdf input1.pdf input2.pdf input3.pdf 
 #making sure these files are in the same directory